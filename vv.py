@@ -1,9 +1,16 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, time, timedelta
-import math
+from datetime import time
+from io import BytesIO
+from collections import namedtuple
+import hashlib
 import numpy as np
 
+try:
+    import polars as pl
+except ImportError:  # Optional: fall back to the pandas groupby
+    pl = None
+
 # =================================================================
 # 1. CONFIGURATION AND ORGANIZATION-SPECIFIC RULES (MODIFIED)
 # =================================================================
@@ -24,165 +31,122 @@ EVENING_HALF_DAY_TIME = time(16, 45)
 ONE_HOUR_LEAVE_START_TIME = time(16, 44)  # <-- CHANGE APPLIED HERE
 ONE_HOUR_LEAVE_END_TIME = time(17, 44)
 
+# The same rules as seconds since midnight, matching the Time In/Out columns
+LATE_UNIT_SEC = LATE_UNIT_MINUTES * 60
+SHIFT_START_SEC = SHIFT_START.hour * 3600 + SHIFT_START.minute * 60 + SHIFT_START.second
+SHIFT_END_SEC = SHIFT_END.hour * 3600 + SHIFT_END.minute * 60 + SHIFT_END.second
+HALF_DAY_START_SEC = HALF_DAY_START_TIME_NEW.hour * 3600 + HALF_DAY_START_TIME_NEW.minute * 60 + HALF_DAY_START_TIME_NEW.second
+HALF_DAY_END_SEC = HALF_DAY_END_TIME_NEW.hour * 3600 + HALF_DAY_END_TIME_NEW.minute * 60 + HALF_DAY_END_TIME_NEW.second
+EVENING_HALF_DAY_SEC = EVENING_HALF_DAY_TIME.hour * 3600 + EVENING_HALF_DAY_TIME.minute * 60 + EVENING_HALF_DAY_TIME.second
+ONE_HOUR_LEAVE_START_SEC = (
+    ONE_HOUR_LEAVE_START_TIME.hour * 3600 + ONE_HOUR_LEAVE_START_TIME.minute * 60 + ONE_HOUR_LEAVE_START_TIME.second
+)
+ONE_HOUR_LEAVE_END_SEC = (
+    ONE_HOUR_LEAVE_END_TIME.hour * 3600 + ONE_HOUR_LEAVE_END_TIME.minute * 60 + ONE_HOUR_LEAVE_END_TIME.second
+)
+
+# Use Polars for the per-employee summary when it is installed (pandas otherwise)
+USE_POLARS = pl is not None
+
 # =================================================================
 # 2. CORE CALCULATION FUNCTIONS
 # =================================================================
 
-def to_time_safe(s):
-    """Safely converts string to time object."""
-    s = str(s).strip()
-    if not s or s in ["00:00", "nan", "NaT"]:
-        return None
-    try:
-        return datetime.strptime(s, "%H:%M").time()
-    except ValueError:
-        try:
-            dt_obj = pd.to_datetime(s, errors='coerce')
-            if pd.notna(dt_obj):
-                return dt_obj.time()
-        except:
-            pass
-    return None
-
-def calculate_late_status(in_time):
-    """Calculates 15-min late units or morning Half Day Leave."""
-    if in_time is None: return 0, 'Missing IN Time', 0
-
-    today = datetime.today().date()
-    shift_start_dt = datetime.combine(today, SHIFT_START)
-    in_time_dt = datetime.combine(today, in_time)
-
-    # --- NEW Half Day Leave Check (IN time between 10:16 and 13:30) ---
-    half_day_start_dt_new = datetime.combine(today, HALF_DAY_START_TIME_NEW)
-    half_day_end_dt_new = datetime.combine(today, HALF_DAY_END_TIME_NEW)
-
-    if in_time_dt >= half_day_start_dt_new and in_time_dt <= half_day_end_dt_new:
-        return 0, 'Half Day Leave (Morning IN)', 1
-    # ------------------------------------------------------------------
-
-    # Late Minutes calculation (only if not an early Half Day)
-    late_minutes = (in_time_dt - shift_start_dt).total_seconds() / 60
-    if late_minutes <= 0: return 0, 'On Time', 0
-
-    # 15 Minute Late check (applies if IN time is after SHIFT_START but before the Half Day Window)
-    late_units = math.ceil(late_minutes / LATE_UNIT_MINUTES)
-    return late_units, f'{late_units} x 15 Min Late', 0
-
-
-def calculate_early_out_status(out_time):
-    """Classifies 1-hour leave or evening Half Day Leave."""
-    if out_time is None: return 0, 'Missing OUT Time', 0
-
-    today = datetime.today().date()
-    shift_end_dt = datetime.combine(today, SHIFT_END)
-    out_time_dt = datetime.combine(today, out_time)
-
-    early_out_minutes = (shift_end_dt - out_time_dt).total_seconds() / 60
-    if early_out_minutes <= 0: return 0, 'On Time/Overtime', 0
-
-    one_hour_leave_start_dt = datetime.combine(today, ONE_HOUR_LEAVE_START_TIME)
-    one_hour_leave_end_dt = datetime.combine(today, ONE_HOUR_LEAVE_END_TIME)
-
-    # 1 Hour Leave check (OUT time between 16:44 and 17:44)
-    if out_time_dt >= one_hour_leave_start_dt and out_time_dt <= one_hour_leave_end_dt:
-        return 1, '1 Hour Leave', 0
-
-    evening_half_day_dt = datetime.combine(today, EVENING_HALF_DAY_TIME)
-    # Evening Half Day Leave check (OUT time <= 16:45)
-    if out_time_dt <= evening_half_day_dt:
-        return 0, 'Half Day Leave (Evening OUT)', 1
-
-    return 0, 'Other Early Out', 0
-
-
-def get_day_classification(row):
-    """Applies strict priority to generate a single, accurate daily status."""
-    is_m_half = row['is_morning_half_day']
-    is_e_half = row['is_evening_half_day']
-    is_1hr_leave = row['early_out_units'] == 1
-    late_units = row['late_units']
-
-    # Priority 1: Full Day Leave 
-    if is_m_half and is_e_half:
-        return 'FULL Day Leave (Morn + Even Half)'
-    # Priority 2: Half Day Leave 
-    if is_m_half: return 'Half Day Leave (Morning IN)'
-    if is_e_half: return 'Half Day Leave (Evening OUT)'
-    # Priority 3: 1 Hour Leave
-    if is_1hr_leave: return '1 Hour Leave (Early OUT)'
-    # Priority 4: Late Units
-    if late_units > 0: return f'{late_units} x 15 Min Late'
-    # Priority 5: On Time / Incomplete Record
-    if row['Time In'] is None or row['Time Out'] is None:
-        return 'Incomplete Record'
-    return 'On Time'
+def parse_time_seconds(series):
+    """Bulk-parses a column of raw time strings into int32 seconds since midnight (-1 where missing)."""
+    raw = series.astype(str).str.strip()
+    raw = raw.where(~raw.isin(["", "00:00", "nan", "NaT"]))
+    parsed = pd.to_datetime(raw, format="%H:%M", errors='coerce')
+
+    # Excel time cells arrive as 'HH:MM:SS'; parse them in bulk too, keeping the seconds
+    retry = parsed.isna() & raw.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(raw[retry], format="%H:%M:%S", errors='coerce')
+
+    # Fall back to a flexible parse only for the cells both strict formats missed
+    retry = parsed.isna() & raw.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(raw[retry], format='mixed', errors='coerce')
+
+    seconds = parsed.dt.hour * 3600 + parsed.dt.minute * 60 + parsed.dt.second
+    return seconds.fillna(-1).astype(np.int32)
 
 
 # =================================================================
 # 3. FIXED DATA PARSING FUNCTION (Ensures correct date/time alignment)
-# ** CACHED for Performance and Stability on File Re-upload **
+# ** CACHED on the uploaded file bytes for Performance and Stability on File Re-upload **
 # =================================================================
 
-@st.cache_data(show_spinner="Processing uploaded report data...")
+@st.cache_data(
+    show_spinner="Reading and processing uploaded report data...",
+    hash_funcs={bytes: lambda b: hashlib.blake2b(b, digest_size=16).hexdigest()}
+)
+def load_and_restructure(file_bytes, file_name):
+    """Reads the uploaded report and restructures it, cached on the file contents."""
+    if file_name.endswith('.xlsx'):
+        df_raw = pd.read_excel(BytesIO(file_bytes), header=None, engine='calamine')
+    else:
+        try:
+            df_raw = pd.read_csv(
+                BytesIO(file_bytes), header=None, encoding='latin1', engine='pyarrow', dtype_backend='pyarrow'
+            )
+        except pd.errors.ParserError:
+            # pyarrow rejects ragged rows; the C engine pads them with NaN
+            df_raw = pd.read_csv(BytesIO(file_bytes), header=None, encoding='latin1', skipinitialspace=True)
+
+    return restructure_attendance_data(df_raw)
+
+
 def restructure_attendance_data(df_raw):
     try:
-        df_raw = df_raw.fillna('')
-        df_raw[0] = df_raw[0].astype(str).str.strip()
+        # Only the anchor column needs cleaning; the rest is read in place
+        col0 = df_raw[0].fillna('').astype(str).str.strip()
 
-        emp_rows = df_raw[df_raw[0].str.contains('^Employee:', regex=True, na=False)].index.tolist()
-        days_row_index = df_raw[df_raw[0].str.contains('^Days$', regex=True, na=False)].index.max()
+        emp_rows = df_raw[col0.str.startswith('Employee:', na=False)].index.tolist()
+        days_row_index = df_raw[col0.eq('Days')].index.max()
 
         if days_row_index is None: return pd.DataFrame()
 
         TIME_START_COL_INDEX = 2
 
-        day_headers_raw = df_raw.iloc[days_row_index, TIME_START_COL_INDEX:].values
-        day_headers_list_full = [str(h).strip() for h in day_headers_raw]
-
-        final_data = []
-
-        for emp_row_index in emp_rows:
-            employee_str = df_raw.iloc[emp_row_index, 3]
-            if str(employee_str).strip() == '': continue
-
-            status_row_index = emp_row_index + 1
-            intime_row_index = emp_row_index + 2
-            outtime_row_index = emp_row_index + 3
-
-            try:
-                status_data = [str(c).strip() for c in df_raw.iloc[status_row_index, TIME_START_COL_INDEX:].values.tolist()]
-                intime_data = [str(c).strip() for c in df_raw.iloc[intime_row_index, TIME_START_COL_INDEX:].values.tolist()]
-                outtime_data = [str(c).strip() for c in df_raw.iloc[outtime_row_index, TIME_START_COL_INDEX:].values.tolist()]
-            except IndexError:
-                continue
+        day_headers = df_raw.iloc[days_row_index, TIME_START_COL_INDEX:].fillna('').astype(str).str.strip().to_numpy()
 
-            min_len = min(len(day_headers_list_full), len(status_data), len(intime_data), len(outtime_data))
+        # Keep employees with a name and a complete Status/IN/OUT block below them
+        emp_rows_arr = np.asarray(emp_rows)
+        emp_rows_arr = emp_rows_arr[emp_rows_arr + 3 < len(df_raw)]
+        employee_raw = df_raw.iloc[emp_rows_arr, 3].fillna('').astype(str)
+        has_name = (employee_raw.str.strip() != '').to_numpy()
+        emp_rows_arr = emp_rows_arr[has_name]
 
-            temp_df = pd.DataFrame({
-                'Employee_Raw': employee_str,
-                'Date/Day': day_headers_list_full[:min_len],
-                'Status': status_data[:min_len],
-                'InTime_Raw': intime_data[:min_len],
-                'OutTime_Raw': outtime_data[:min_len]
-            })
+        if len(emp_rows_arr) == 0: return pd.DataFrame()
 
-            temp_df['Employee Name'] = temp_df['Employee_Raw'].apply(lambda x: str(x).split(':')[-1].strip())
-            temp_df['Time In'] = temp_df['InTime_Raw'].apply(to_time_safe)
-            temp_df['Time Out'] = temp_df['OutTime_Raw'].apply(to_time_safe)
+        emp_names = employee_raw[has_name].astype('string').str.rsplit(':', n=1).str[-1].str.strip().to_numpy()
+        status_block = df_raw.iloc[emp_rows_arr + 1, TIME_START_COL_INDEX:].to_numpy(dtype=object, na_value='')
+        intime_block = df_raw.iloc[emp_rows_arr + 2, TIME_START_COL_INDEX:].to_numpy(dtype=object, na_value='')
+        outtime_block = df_raw.iloc[emp_rows_arr + 3, TIME_START_COL_INDEX:].to_numpy(dtype=object, na_value='')
 
-            if not temp_df.empty:
-                final_data.append(temp_df)
+        # Reshape the (employees x days) blocks into one long frame
+        num_employees, num_days = status_block.shape
+        df_structured = pd.DataFrame({
+            'Employee Name': np.repeat(emp_names, num_days),
+            'Date/Day': np.tile(day_headers, num_employees),
+            'Status': status_block.ravel(),
+            'InTime_Raw': intime_block.ravel(),
+            'OutTime_Raw': outtime_block.ravel()
+        })
+        df_structured['Status'] = df_structured['Status'].astype(str).str.strip().astype('category')
 
-        if not final_data: return pd.DataFrame()
+        df_structured['Time In'] = parse_time_seconds(df_structured['InTime_Raw'])
+        df_structured['Time Out'] = parse_time_seconds(df_structured['OutTime_Raw'])
 
-        df_structured = pd.concat(final_data, ignore_index=True)
-
-        df_clean = df_structured[(df_structured['Status'] == 'P')].copy()
-        df_clean = df_clean[df_clean['Time In'].notna() | df_clean['Time Out'].notna()].copy()
+        # Present days with at least one punch, filtered and trimmed in one step
+        mask = (df_structured['Status'] == 'P') & ((df_structured['Time In'] != -1) | (df_structured['Time Out'] != -1))
+        df_clean = df_structured.loc[mask, ['Employee Name', 'Date/Day', 'Time In', 'Time Out']]
 
         if df_clean.empty: return pd.DataFrame()
 
-        return df_clean[['Employee Name', 'Date/Day', 'Time In', 'Time Out']]
+        df_clean['Employee Name'] = df_clean['Employee Name'].astype('category')
+        return df_clean
 
     except Exception as e:
         st.error(f"A severe structural error occurred during file parsing: {e}")
@@ -192,48 +156,74 @@ def restructure_attendance_data(df_raw):
 # 4. NEW CONSOLIDATED REPORTING FUNCTION
 # =================================================================
 
+# Summary table plus the per-row calculated frame it was built from
+ConsolidatedReport = namedtuple('ConsolidatedReport', ['summary', 'calculated'])
+
+
+@st.cache_data(
+    show_spinner=False,
+    hash_funcs={pd.DataFrame: lambda d: pd.util.hash_pandas_object(d, index=True).values.tobytes()}
+)
 def generate_consolidated_report(df_processed):
     """
     Applies calculations to the entire processed dataframe and generates 
     a single, consolidated summary table for all employees.
     """
     if df_processed.empty:
-        return pd.DataFrame()
+        return ConsolidatedReport(pd.DataFrame(), pd.DataFrame())
 
     # Apply calculations to the entire dataframe
     df_calculated = df_processed.copy()
     
+    in_s = df_calculated['Time In'].to_numpy()
+    out_s = df_calculated['Time Out'].to_numpy()
+
+    # Mask missing punches once; every rule below only fires on valid times
+    has_in = in_s != -1
+    has_out = out_s != -1
+
     # Calculate late status
-    df_calculated[['late_units', 'late_classification', 'is_morning_half_day']] = df_calculated['Time In'].apply(
-        lambda x: pd.Series(calculate_late_status(x) if pd.notna(x) else (0, 'Missing IN Time', 0))
-    )
+    is_morning_half_day = has_in & (in_s >= HALF_DAY_START_SEC) & (in_s <= HALF_DAY_END_SEC)
+    late_seconds = np.where(has_in & ~is_morning_half_day & (in_s > SHIFT_START_SEC), in_s - SHIFT_START_SEC, 0)
+    late_units = ((late_seconds + LATE_UNIT_SEC - 1) // LATE_UNIT_SEC).astype(np.int32)
+
+    df_calculated['late_units'] = late_units
+    df_calculated['is_morning_half_day'] = is_morning_half_day.astype(np.int8)
+
     # Calculate early out status
-    df_calculated[['early_out_units', 'early_out_classification', 'is_evening_half_day']] = df_calculated['Time Out'].apply(
-        lambda x: pd.Series(calculate_early_out_status(x) if pd.notna(x) else (0, 'Missing OUT Time', 0))
-    )
+    is_early_out = has_out & (out_s < SHIFT_END_SEC)
+    is_one_hour = is_early_out & (out_s >= ONE_HOUR_LEAVE_START_SEC) & (out_s <= ONE_HOUR_LEAVE_END_SEC)
+    is_evening_half_day = is_early_out & ~is_one_hour & (out_s <= EVENING_HALF_DAY_SEC)
+
+    df_calculated['early_out_units'] = is_one_hour.astype(np.int32)
+    df_calculated['is_evening_half_day'] = is_evening_half_day.astype(np.int8)
     
     # Calculate Half Day Flag (1 if either morning or evening half day)
-    df_calculated['is_half_day'] = np.where(
-        (df_calculated['is_morning_half_day'] == 1) | (df_calculated['is_evening_half_day'] == 1), 
-        1, 
-        0
-    )
+    is_half_day = is_morning_half_day | is_evening_half_day
+    df_calculated['is_half_day'] = is_half_day.view(np.int8)
     
     # Calculate 1 Hour Leave Flag
-    df_calculated['is_one_hour_leave'] = np.where(
-        (df_calculated['is_half_day'] == 0) & (df_calculated['early_out_units'] == 1), 
-        1, 
-        0
-    )
+    df_calculated['is_one_hour_leave'] = (~is_half_day & is_one_hour).view(np.int8)
     
     # Group by Employee Name and sum the incident units
-    consolidated_summary = df_calculated.groupby('Employee Name').agg(
-        **{
-            'Total 15 Min Late Units': ('late_units', 'sum'),
-            'Total Half Day Incidents': ('is_half_day', 'sum'),
-            'Total 1 Hour Leaves': ('is_one_hour_leave', 'sum')
-        }
-    ).reset_index()
+    if USE_POLARS:
+        consolidated_summary = (
+            pl.from_pandas(df_calculated[['Employee Name', 'late_units', 'is_half_day', 'is_one_hour_leave']])
+            .group_by('Employee Name')
+            .agg([
+                pl.col('late_units').sum().alias('Total 15 Min Late Units'),
+                pl.col('is_half_day').sum().alias('Total Half Day Incidents'),
+                pl.col('is_one_hour_leave').sum().alias('Total 1 Hour Leaves')
+            ])
+            .sort('Employee Name')
+            .to_pandas()
+        )
+    else:
+        # One groupby-sum over all incident columns shares a single pass over the keys
+        incident_flags = df_calculated[['late_units', 'is_half_day', 'is_one_hour_leave']]
+        consolidated_summary = incident_flags.groupby(
+            df_calculated['Employee Name'], sort=True, observed=True
+        ).sum().reset_index()
 
     # Rename columns for the final display
     consolidated_summary.columns = [
@@ -243,7 +233,7 @@ def generate_consolidated_report(df_processed):
         '1 Hour Leaves'
     ]
     
-    return consolidated_summary, df_calculated
+    return ConsolidatedReport(consolidated_summary, df_calculated)
 
 
 # =================================================================
@@ -299,23 +289,17 @@ def app():
     
     if uploaded_file is not None:
         try:
-            # Check file extension and read accordingly
-            if uploaded_file.name.endswith('.xlsx'):
-                df_raw = pd.read_excel(uploaded_file, header=None, engine='openpyxl')
-            else: 
-                df_raw = pd.read_csv(uploaded_file, header=None, encoding='latin1', skipinitialspace=True)
+            # Read and restructure the raw report data (Cached on the file bytes)
+            df_processed = load_and_restructure(uploaded_file.getvalue(), uploaded_file.name)
 
             st.sidebar.success("File uploaded and read successfully!")
             
-            # Restructure the raw report data (Cached function runs here)
-            df_processed = restructure_attendance_data(df_raw.copy())
-            
             if df_processed.empty: 
                 st.error("Could not parse employee data. Please ensure the file structure is correct.")
                 return 
 
             # Generate the single consolidated report
-            consolidated_summary_df, _ = generate_consolidated_report(df_processed)
+            consolidated_summary_df = generate_consolidated_report(df_processed).summary
 
             if not consolidated_summary_df.empty:
                 st.subheader("📊 Consolidated Lateness and Leave Summary for All Employees")